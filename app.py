@@ -1,13 +1,18 @@
 import os
+import io
 import re
 import time
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+import altair as alt
 import pandas as pd
 import numpy as np
-from collections import Counter
 from wordcloud import WordCloud
-import matplotlib.pyplot as plt
+import matplotlib as mpl
 import matplotlib.font_manager as fm
 import seaborn as sns
 from datetime import datetime, timedelta, timezone
@@ -33,8 +38,8 @@ def load_font():
     font_prop = fm.FontProperties(fname=font_path)
 
     # matplotlib 전역 폰트 설정
-    plt.rcParams["font.family"] = font_prop.get_name()
-    plt.rcParams["axes.unicode_minus"] = False
+    mpl.rcParams["font.family"] = font_prop.get_name()
+    mpl.rcParams["axes.unicode_minus"] = False
 
     # seaborn 폰트 설정
     sns.set(font=font_prop.get_name())
@@ -55,7 +60,7 @@ font_prop, FONT_PATH = get_font_cached()
 BASE_URL = "https://www.googleapis.com/youtube/v3"
 KST = timezone(timedelta(hours=9))
 
-DEFAULT_STOPWORDS = {
+DEFAULT_STOPWORDS = frozenset({
     "영상", "동영상", "브이로그", "vlog",
     "the", "a", "to", "of", "in", "on", "for", "and", "is", "are", "with", "from",
     "한", "것", "수", "이", "그", "저", "및", "등", "때", "때문",
@@ -64,9 +69,29 @@ DEFAULT_STOPWORDS = {
     "shorts", "short",
     "공식", "official", "full",
     "2023", "2024", "2025"
-}
+})
 
-TOKEN_PATTERN = re.compile(r"[A-Za-z가-힣]+")
+# 2글자 이상만 매칭해서 1글자 토큰은 정규식 단계에서 바로 제외
+TOKEN_PATTERN = re.compile(r"[A-Za-z가-힣]{2,}")
+
+# YouTube videoId는 항상 [A-Za-z0-9_-] 11자
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+VIDEO_COLUMNS = [
+    "videoId", "title", "description", "channelTitle", "publishedAt",
+    "viewCount", "likeCount", "commentCount",
+]
+COUNT_COLUMNS = ["viewCount", "likeCount", "commentCount"]
+TEXT_COLUMNS = ["title", "description", "channelTitle", "publishedAt"]
+
+# 검색 페이지별 videos.list 호출을 병렬로 보낼 때 사용할 스레드 수
+STATS_WORKERS = 4
+
+# 검색 기간 끝 시각을 맞추는 단위 (초) — 이 구간 안에서는 캐시가 재사용됨
+SEARCH_WINDOW_SECONDS = 600
+
+# 상위 영상 표에 보여줄 최대 행 수
+TOP_N_DISPLAY = 100
 
 # =============================
 # API 키 로딩
@@ -82,6 +107,32 @@ API_KEY = load_api_key()
 # =============================
 # YouTube API 호출 유틸
 # =============================
+# 요청마다 TCP/TLS 연결을 새로 맺지 않도록 세션을 공유 (keep-alive)
+# 재실행마다 새 세션이 생기면 연결 재사용이 안 되므로 st.cache_resource로 한 번만 생성
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    # 재시도가 모두 실패해도 RetryError(요청 URL에 API 키 포함) 대신 마지막 응답을 돌려받아
+    # 아래 yt_get_cached의 상태 코드 분기에서 API 오류 본문을 그대로 보여주도록 함
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    )
+    session.mount(
+        "https://",
+        HTTPAdapter(max_retries=retry, pool_connections=8, pool_maxsize=8),
+    )
+    # Google API는 User-Agent에 "gzip"이 포함되어야 응답을 gzip으로 압축해서 보내줌
+    session.headers.update({
+        "Accept-Encoding": "gzip",
+        "User-Agent": "yt-trend (gzip)",
+    })
+    return session
+
+SESSION = get_session()
+
 def yt_get(path, params, sleep=0.0):
     if not API_KEY:
         raise RuntimeError(
@@ -89,34 +140,44 @@ def yt_get(path, params, sleep=0.0):
             'YOUTUBE_API_KEY = "실제_API_KEY" 형식으로 등록하세요.'
         )
 
-    final_params = dict(params)
+    # API 키는 캐시 키에 들어가지 않도록 호출 직전에만 붙이고, params는 정렬된 튜플로 해시
+    return yt_get_cached(path, tuple(sorted(params.items())), sleep)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def yt_get_cached(path, params_items, sleep=0.0):
+    final_params = dict(params_items)
     final_params["key"] = API_KEY
     url = f"{BASE_URL}/{path}"
 
-    r = requests.get(url, params=final_params, timeout=30)
+    r = SESSION.get(url, params=final_params, timeout=30)
     if sleep:
         time.sleep(sleep)
 
     if r.status_code != 200:
         raise RuntimeError(f"API 오류 {r.status_code}: {r.text}")
-    return r.json()
+    # stdlib json보다 빠른 orjson으로 바이트를 바로 디코딩
+    return orjson.loads(r.content)
 
 def youtube_search(keyword, published_after, published_before, region_code, max_results=50):
-    ids = []
-    fetched = 0
+    # 페이지를 받을 때마다 새로 나온 id 묶음을 바로 넘겨줌 (호출 쪽에서 통계 수집과 겹치기 위함)
+    # 페이지 간 중복이 있을 수 있으므로 고유 id 수를 기준으로 멈추되,
+    # 중복이 계속 나와도 호출(페이지당 쿼터 100)이 무한히 늘지 않도록 페이지 수에 상한을 둠
+    seen = set()
     next_page_token = None
+    max_pages = -(-max_results // 50) + 1
 
-    while fetched < max_results:
-        page_size = min(50, max_results - fetched)
-
+    for _ in range(max_pages):
         query_params = {
             "part": "id",
             "type": "video",
             "q": keyword,
             "publishedAfter": published_after,
             "publishedBefore": published_before,
-            "maxResults": page_size,
+            # 쿼터는 페이지 크기와 무관하므로 항상 최대(50)로 받아 중복분을 보충
+            "maxResults": 50,
             "order": "relevance",
+            # 다음 페이지 토큰과 videoId만 받도록 응답 필드를 제한
+            "fields": "items(id/videoId),nextPageToken",
         }
         if region_code:
             query_params["regionCode"] = region_code
@@ -126,87 +187,129 @@ def youtube_search(keyword, published_after, published_before, region_code, max_
         data = yt_get("search", query_params, sleep=0.05)
 
         items = data.get("items", [])
+        batch = []
         for item in items:
             vid = item.get("id", {}).get("videoId")
-            if vid:
-                ids.append(vid)
+            if vid and vid not in seen:
+                seen.add(vid)
+                batch.append(vid)
+                if len(seen) >= max_results:
+                    break
+        if batch:
+            yield batch
 
-        fetched += len(items)
         next_page_token = data.get("nextPageToken")
-        if (not next_page_token) or (len(items) == 0):
+        if (len(seen) >= max_results) or (not next_page_token) or (len(items) == 0):
             break
 
-    return list(dict.fromkeys(ids))
-
-def youtube_videos_stats(video_ids):
-    rows = []
+def youtube_videos_items(video_ids):
+    # 형식이 잘못된 id로 API를 낭비하지 않도록 미리 걸러냄
+    video_ids = [v for v in video_ids if v and VIDEO_ID_PATTERN.match(v)]
 
+    items = []
     for i in range(0, len(video_ids), 50):
-        chunk = ",".join(video_ids[i:i+50])
         data = yt_get(
             "videos",
-            {"part": "snippet,statistics,contentDetails", "id": chunk},
-            sleep=0.05,
+            {
+                "part": "snippet,statistics",
+                "id": ",".join(video_ids[i:i+50]),
+                # 사용하는 필드만 받아 응답 크기와 JSON 파싱 비용을 줄임
+                "fields": (
+                    "items(id,snippet(title,description,channelTitle,publishedAt),"
+                    "statistics(viewCount,likeCount,commentCount))"
+                ),
+            },
         )
-
-        for it in data.get("items", []):
-            s = it.get("snippet", {})
-            stats = it.get("statistics", {})
-            row = {
-                "videoId": it.get("id"),
-                "title": s.get("title", ""),
-                "description": s.get("description", ""),
-                "channelTitle": s.get("channelTitle", ""),
-                "publishedAt": s.get("publishedAt", ""),
-                "viewCount": int(stats.get("viewCount", 0) or 0),
-                "likeCount": int(stats.get("likeCount", 0) or 0),
-                "commentCount": int(stats.get("commentCount", 0) or 0),
-            }
-            rows.append(row)
-
-    df = pd.DataFrame(rows)
+        items.extend(data.get("items", []))
+    return items
+
+def videos_stats_frame(items):
+    # 행마다 dict를 만들지 않고 컬럼별 리스트(dict-of-lists)에 바로 담아 DataFrame으로 변환
+    cols = {c: [] for c in VIDEO_COLUMNS}
+    for it in items:
+        snippet = it.get("snippet", {})
+        stats = it.get("statistics", {})
+        cols["videoId"].append(it.get("id"))
+        for c in TEXT_COLUMNS:
+            cols[c].append(snippet.get(c, ""))
+        for c in COUNT_COLUMNS:
+            cols[c].append(stats.get(c))
+
+    df = pd.DataFrame(cols)
+    # 통계 값은 API가 문자열로 주므로 컬럼 단위로 한 번에 변환 (숨김/누락은 0)
+    df[COUNT_COLUMNS] = (
+        df[COUNT_COLUMNS].apply(pd.to_numeric, errors="coerce").fillna(0).astype(np.int64)
+    )
 
     if not df.empty:
-        df["publishedAt"] = pd.to_datetime(df["publishedAt"], errors="coerce")
-        df["ER(%)"] = np.where(
-            df["viewCount"] > 0,
-            (df["likeCount"] + df["commentCount"]) / df["viewCount"] * 100.0,
-            0.0,
-        ).round(3)
+        # YouTube는 항상 RFC 3339(UTC) 형식이므로 형식 추론 없이 ISO8601 고정 경로로 파싱
+        df["publishedAt"] = pd.to_datetime(
+            df["publishedAt"], format="ISO8601", errors="coerce", utc=True
+        )
+        # 중간 배열을 줄이기 위해 float32 버퍼에 바로 나눗셈 결과를 기록 (조회수 0은 0 유지)
+        view = df["viewCount"].to_numpy(np.float32)
+        num = df["likeCount"].to_numpy() + df["commentCount"].to_numpy()
+        er = np.zeros(len(df), dtype=np.float32)
+        np.divide(num, view, out=er, where=view > 0)
+        er *= np.float32(100.0)
+        df["ER(%)"] = er.round(3)
 
     return df
 
+@st.cache_data(ttl=600, show_spinner=False)
+def youtube_collect(keyword, published_after, published_before, region_code, max_results=50):
+    # 검색 페이지가 도착하는 대로 해당 id 묶음의 videos.list를 병렬로 요청해
+    # 검색 왕복과 통계 수집 왕복을 겹침 (쿼터는 서버에서 계산되므로 sleep 불필요)
+    with ThreadPoolExecutor(max_workers=STATS_WORKERS) as executor:
+        id_count = 0
+        futures = []
+        for batch in youtube_search(
+            keyword, published_after, published_before, region_code, max_results
+        ):
+            id_count += len(batch)
+            futures.append(executor.submit(youtube_videos_items, batch))
+        # 검색 순서를 유지하기 위해 제출 순서대로 결과를 모음
+        items = [it for fut in futures for it in fut.result()]
+
+    # 검색 결과가 없는 경우와 통계만 비어 있는 경우를 화면에서 구분할 수 있도록 검색된 id 수도 함께 반환
+    return id_count, videos_stats_frame(items)
+
 # =============================
 # 텍스트 처리 / 키워드 추출
 # =============================
-def tokenize(text: str):
-    tokens = TOKEN_PATTERN.findall(text.lower())
-    return [t for t in tokens if t not in DEFAULT_STOPWORDS and len(t) >= 2]
-
 def keywords_from_df(df, topn=100):
-    corpus = []
-    for _, row in df.iterrows():
-        title_txt = row.get("title", "")
-        desc_txt = row.get("description", "")
-        corpus.extend(tokenize(f"{title_txt} {desc_txt}"))
-
-    counter = Counter(corpus)
-    return counter.most_common(topn)
+    # 행마다 정규식을 돌리지 않고, 전체 텍스트를 하나로 합쳐 한 번에 토큰화
+    text = df["title"].fillna("") + " " + df["description"].fillna("")
+    return keywords_from_corpus(text.str.cat(sep="\n"), topn=topn)
+
+# 같은 텍스트를 재실행마다 다시 세지 않도록 문자열 입력 기준으로 캐시
+@st.cache_data(max_entries=16, show_spinner=False)
+def keywords_from_corpus(corpus_text, topn=100):
+    # 불용어 제외와 빈도 집계를 Python 루프 대신 pandas(C) 연산으로 처리 (불용어는 모두 소문자)
+    tokens = pd.Series(TOKEN_PATTERN.findall(corpus_text.lower()), dtype=object)
+    # 빈도가 같으면 먼저 등장한 키워드가 앞에 오도록 등장 순서 집계 후 안정 정렬
+    counts = (
+        tokens[~tokens.isin(DEFAULT_STOPWORDS)]
+        .value_counts(sort=False)
+        .sort_values(ascending=False, kind="stable")
+        .head(topn)
+    )
+    return list(zip(counts.index.tolist(), counts.tolist()))
 
-def draw_wordcloud(freqs, font_path):
+# 같은 키워드 빈도면 레이아웃 계산을 다시 하지 않도록 결과 배열을 캐시 (freqs는 튜플로 전달)
+@st.cache_data(max_entries=16, show_spinner=False)
+def wordcloud_array(freqs, font_path, width=900, height=500):
     wc = WordCloud(
-        width=900,
-        height=500,
+        width=width,
+        height=height,
         background_color="white",
         font_path=font_path,
         collocations=False
     )
     wc.generate_from_frequencies(dict(freqs))
 
-    fig = plt.figure(figsize=(9, 5))
-    plt.imshow(wc, interpolation="bilinear")
-    plt.axis("off")
-    return fig
+    # 레이아웃 결과만 RGB 배열로 반환하고, 표시는 호출하는 쪽(st.image)에서 담당
+    return wc.to_array()
 
 # =============================
 # UI
@@ -221,6 +324,8 @@ with st.sidebar:
     days = st.number_input("최근 N일", min_value=1, max_value=365, value=30, step=1)
     max_results = st.slider("수집할 영상 수", min_value=10, max_value=200, value=80, step=10)
     region_code = st.text_input("지역 코드 (선택, KR/US/JP 등)", value="KR").strip().upper()
+    # 워드클라우드 레이아웃은 무거우므로 끄면 상위 키워드 막대 차트만 그림
+    use_wordcloud = st.checkbox("워드클라우드 사용", value=True)
 
     st.markdown("---")
 
@@ -231,7 +336,9 @@ with st.sidebar:
 
     run = st.button("데이터 수집/분석 실행", type="primary", use_container_width=True)
 
-now_utc = datetime.now(timezone.utc)
+# 재실행마다 시각이 달라지면 캐시가 무효화되므로 10분 단위 구간의 시작 시각으로 맞춤
+window_start = int(time.time()) // SEARCH_WINDOW_SECONDS * SEARCH_WINDOW_SECONDS
+now_utc = datetime.fromtimestamp(window_start, tz=timezone.utc)
 published_after = (now_utc - timedelta(days=int(days))).isoformat()
 published_before = now_utc.isoformat()
 
@@ -241,8 +348,8 @@ if run:
         st.stop()
 
     try:
-        with st.spinner("검색 중…"):
-            ids = youtube_search(
+        with st.spinner("검색 및 영상 메타데이터/통계 수집 중…"):
+            id_count, df = youtube_collect(
                 keyword=keyword,
                 published_after=published_after,
                 published_before=published_before,
@@ -250,63 +357,87 @@ if run:
                 max_results=max_results
             )
 
-        if len(ids) == 0:
+        if id_count == 0:
             st.warning("검색 결과가 없습니다. 키워드/기간/지역 코드를 조정해보세요.")
+        elif df.empty:
+            st.warning("수집된 통계가 없습니다.")
         else:
-            with st.spinner("영상 메타데이터/통계 수집 중…"):
-                df = youtube_videos_stats(ids)
-
-            if df.empty:
-                st.warning("수집된 통계가 없습니다.")
-            else:
-                st.success(f"수집 완료: {len(df)}개 영상")
-
-                c1, c2, c3, c4 = st.columns(4)
-                with c1:
-                    st.metric("총 조회수", f"{df['viewCount'].sum():,}")
-                with c2:
-                    st.metric("평균 ER(%)", f"{df['ER(%)'].mean():.2f}")
-                with c3:
-                    st.metric("평균 댓글 수", f"{df['commentCount'].mean():.1f}")
-                with c4:
-                    st.metric("분석 기간(일)", f"{days}")
-
-                st.subheader("상위 영상 (ER 내림차순)")
-                df_sorted = df.sort_values(["ER(%)", "viewCount"], ascending=[False, False]).reset_index(drop=True)
-
-                st.dataframe(
-                    df_sorted[[
-                        "title", "channelTitle", "viewCount",
-                        "likeCount", "commentCount", "ER(%)",
-                        "publishedAt", "videoId"
-                    ]],
-                    use_container_width=True,
-                    height=360
+            st.success(f"수집 완료: {len(df)}개 영상")
+
+            freqs = keywords_from_df(df, topn=120)
+
+            # 워드클라우드 레이아웃은 표/지표 렌더링과 독립적이므로 미리 백그라운드에서 생성
+            # (세션끼리 서로 기다리지 않도록 실행마다 스레드를 따로 띄움)
+            wordcloud_future = None
+            wordcloud_executor = None
+            if use_wordcloud and len(freqs) > 0:
+                wordcloud_executor = ThreadPoolExecutor(max_workers=1)
+                wordcloud_future = wordcloud_executor.submit(
+                    wordcloud_array, tuple(freqs), FONT_PATH
                 )
 
+            c1, c2, c3, c4 = st.columns(4)
+            with c1:
+                st.metric("총 조회수", f"{df['viewCount'].sum():,}")
+            with c2:
+                st.metric("평균 ER(%)", f"{df['ER(%)'].mean():.2f}")
+            with c3:
+                st.metric("평균 댓글 수", f"{df['commentCount'].mean():.1f}")
+            with c4:
+                st.metric("분석 기간(일)", f"{days}")
+
+            st.subheader("상위 영상 (ER 내림차순)")
+            # 정렬은 한 번만 하고, 표는 상위 N개만 / CSV는 전체를 같은 순서로 사용
+            df_sorted = df.sort_values(["ER(%)", "viewCount"], ascending=[False, False]).reset_index(drop=True)
+
+            st.dataframe(
+                df_sorted.head(TOP_N_DISPLAY)[[
+                    "title", "channelTitle", "viewCount",
+                    "likeCount", "commentCount", "ER(%)",
+                    "publishedAt", "videoId"
+                ]],
+                use_container_width=True,
+                height=360
+            )
+
+            top_k = pd.DataFrame(freqs[:30], columns=["keyword", "freq"])
+
+            if use_wordcloud:
                 st.subheader("워드클라우드 (제목+설명 기반)")
-                freqs = keywords_from_df(df_sorted, topn=120)
-                if len(freqs) == 0:
-                    st.info("유의미한 키워드가 부족합니다. 불용어를 줄이거나 기간/영상 수를 늘려보세요.")
-                else:
-                    fig = draw_wordcloud(freqs, font_path=FONT_PATH)
-                    st.pyplot(fig, clear_figure=True)
-
-                st.subheader("키워드 상위 빈도")
-                top_k = pd.DataFrame(freqs[:30], columns=["keyword", "freq"])
-                st.dataframe(top_k, use_container_width=True, height=400)
-
-                st.subheader("참여율(ER%) vs 조회수")
-                st.scatter_chart(df_sorted, x="viewCount", y="ER(%)", size="commentCount", color=None)
-                st.caption("버블 크기는 댓글 수. ER(%) = (좋아요 수 + 댓글 수) / 조회수 × 100")
-
-                st.download_button(
-                    label="CSV 다운로드",
-                    data=df_sorted.to_csv(index=False).encode("utf-8-sig"),
-                    file_name=f"yt_{keyword}_{days}d.csv",
-                    mime="text/csv",
-                    use_container_width=True
+            else:
+                st.subheader("키워드 빈도 차트 (제목+설명 기반)")
+            if len(freqs) == 0:
+                st.info("유의미한 키워드가 부족합니다. 불용어를 줄이거나 기간/영상 수를 늘려보세요.")
+            elif use_wordcloud:
+                st.image(wordcloud_future.result(), use_column_width=True)
+                wordcloud_executor.shutdown(wait=False)
+            else:
+                # st.bar_chart는 범주 축을 알파벳순으로 정렬하므로 빈도순 정렬을 명시
+                bar = alt.Chart(top_k).mark_bar().encode(
+                    x=alt.X("freq:Q", title="freq"),
+                    y=alt.Y("keyword:N", sort="-x", title=None),
                 )
+                st.altair_chart(bar, use_container_width=True)
+
+            st.subheader("키워드 상위 빈도")
+            st.dataframe(top_k, use_container_width=True, height=400)
+
+            st.subheader("참여율(ER%) vs 조회수")
+            st.scatter_chart(df, x="viewCount", y="ER(%)", size="commentCount", color=None)
+            st.caption("버블 크기는 댓글 수. ER(%) = (좋아요 수 + 댓글 수) / 조회수 × 100")
+
+            # str로 만든 뒤 다시 인코딩하지 않고 바이트 버퍼에 바로 기록 (엑셀 호환용 BOM 포함)
+            csv_buf = io.BytesIO()
+            csv_buf.write(b"\xef\xbb\xbf")
+            df_sorted.to_csv(csv_buf, index=False, encoding="utf-8", lineterminator="\n")
+
+            st.download_button(
+                label="CSV 다운로드",
+                data=csv_buf.getvalue(),
+                file_name=f"yt_{keyword}_{days}d.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
 
     except Exception as e:
         st.error(f"오류: {e}")